@@ -0,0 +1,211 @@
+import os
+import re
+import struct
+import zipfile
+from rich.console import Console
+
+console = Console()
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif')
+# El comentario del volumen guarda un capítulo por línea para poder añadir nuevos sin duplicar
+COMMENT_HEADER = b'cbzvol\n'
+
+def natural_key(text):
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', text)]
+
+def is_volume(path):
+    try:
+        with zipfile.ZipFile(path) as archive:
+            return archive.comment.startswith(COMMENT_HEADER)
+    except (zipfile.BadZipFile, OSError):
+        return False
+
+def list_chapter_files(folder):
+    # Los volúmenes se guardan en la misma carpeta; no deben aparecer como capítulos
+    files = [
+        name for name in os.listdir(folder)
+        if name.lower().endswith('.cbz') and not is_volume(os.path.join(folder, name))
+    ]
+    return [os.path.join(folder, name) for name in sorted(files, key=natural_key)]
+
+def read_raw_entry(fp, info):
+    """
+    • Lee los bytes comprimidos de una entrada tal cual están en el ZIP.
+    • No descomprime: se salta la cabecera local y copia compress_size bytes.
+    """
+    fp.seek(info.header_offset)
+    header = fp.read(zipfile.sizeFileHeader)
+    if len(header) != zipfile.sizeFileHeader or header[:4] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"Cabecera local inválida para {info.filename}")
+    fields = struct.unpack(zipfile.structFileHeader, header)
+    # Campos 10 y 11: longitud del nombre y del campo extra
+    fp.seek(fields[10] + fields[11], os.SEEK_CUR)
+    data = fp.read(info.compress_size)
+    if len(data) != info.compress_size:
+        raise zipfile.BadZipFile(f"Datos truncados para {info.filename}")
+    return data
+
+def write_raw_entry(archive, source_info, arcname, data):
+    """
+    • Escribe una entrada ya comprimida en el ZIP de destino sin recomprimir.
+    • Reutiliza CRC, tamaños y método de compresión de la entrada original.
+    • Usa atributos internos de zipfile porque no hay API pública para copias en crudo.
+    """
+    info = zipfile.ZipInfo(arcname, date_time=source_info.date_time)
+    info.compress_type = source_info.compress_type
+    info.CRC = source_info.CRC
+    info.compress_size = source_info.compress_size
+    info.file_size = source_info.file_size
+    info.external_attr = source_info.external_attr
+    # Sin descriptor de datos: los tamaños van en la cabecera local
+    info.flag_bits = source_info.flag_bits & ~0x08
+
+    archive.fp.seek(archive.start_dir)
+    info.header_offset = archive.fp.tell()
+    archive.fp.write(info.FileHeader(zip64=None))
+    archive.fp.write(data)
+    archive.start_dir = archive.fp.tell()
+    archive.filelist.append(info)
+    archive.NameToInfo[info.filename] = info
+    archive._didModify = True
+
+def read_bundled_chapters(archive):
+    if not archive.comment.startswith(COMMENT_HEADER):
+        return []
+    lines = archive.comment[len(COMMENT_HEADER):].decode('utf-8', errors='ignore').splitlines()
+    return [line for line in lines if line]
+
+def next_page_number(archive):
+    numbers = [
+        int(os.path.splitext(name)[0])
+        for name in archive.namelist()
+        if os.path.splitext(name)[0].isdigit()
+    ]
+    return max(numbers, default=0) + 1
+
+def read_chapter_pages(chapter_path):
+    """
+    • Lee y valida todas las páginas de un capítulo antes de escribir nada en el volumen.
+    • Devuelve (info, datos comprimidos) en orden natural de nombre.
+    """
+    with zipfile.ZipFile(chapter_path) as chapter:
+        pages = [
+            info for info in chapter.infolist()
+            if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS)
+        ]
+    pages.sort(key=lambda info: natural_key(info.filename))
+    if any(info.flag_bits & 0x01 for info in pages):
+        raise zipfile.BadZipFile("contiene páginas cifradas")
+
+    with open(chapter_path, 'rb') as fp:
+        return [(info, read_raw_entry(fp, info)) for info in pages]
+
+def rollback_entries(archive, start_dir, entries):
+    # Al cerrar, el directorio central se escribe en start_dir y el modo 'a' trunca el resto
+    for info in archive.filelist[entries:]:
+        archive.NameToInfo.pop(info.filename, None)
+    del archive.filelist[entries:]
+    archive.start_dir = start_dir
+
+def bundle_volume(chapter_paths, volume_path, append=False):
+    """
+    • Une varios CBZ de capítulos en un único CBZ de volumen.
+    • Las páginas se copian comprimidas, sin decodificar ni recomprimir.
+    • Las páginas se renumeran en orden (00001.jpg, 00002.jpg, ...).
+    • Con append=True añade solo los capítulos nuevos al final del volumen existente.
+    """
+    mode = 'a' if append and os.path.exists(volume_path) else 'w'
+    added_chapters = 0
+    added_pages = 0
+
+    with zipfile.ZipFile(volume_path, mode) as volume:
+        bundled = read_bundled_chapters(volume)
+        page = next_page_number(volume)
+
+        for chapter_path in chapter_paths:
+            chapter_key = os.path.basename(chapter_path)
+            if os.path.abspath(chapter_path) == os.path.abspath(volume_path):
+                continue
+            if chapter_key in bundled:
+                console.print(f"[yellow]Ya incluido en el volumen, se omite:[/yellow] {chapter_key}")
+                continue
+
+            try:
+                pages = read_chapter_pages(chapter_path)
+            except (zipfile.BadZipFile, OSError) as e:
+                console.print(f"[red]Error: {chapter_key} no se puede copiar ({e}), se omite[/red]")
+                continue
+
+            # Un capítulo entra completo o no entra: si falla la escritura se deshacen sus páginas
+            checkpoint = (volume.start_dir, len(volume.filelist))
+            try:
+                for offset, (info, data) in enumerate(pages):
+                    ext = os.path.splitext(info.filename)[1].lower()
+                    write_raw_entry(volume, info, f'{page + offset:05d}{ext}', data)
+            except Exception:
+                rollback_entries(volume, *checkpoint)
+                volume.comment = COMMENT_HEADER + '\n'.join(bundled).encode('utf-8')
+                raise
+
+            page += len(pages)
+            added_pages += len(pages)
+            bundled.append(chapter_key)
+            added_chapters += 1
+
+        volume.comment = COMMENT_HEADER + '\n'.join(bundled).encode('utf-8')
+
+    console.print(f"[blue]Volumen actualizado:[/blue] {volume_path} (+{added_chapters} capítulos, +{added_pages} páginas)")
+    return added_chapters, added_pages
+
+def main():
+    try:
+        folder = input("Carpeta con los CBZ de capítulos (vacío para la actual): ").strip() or '.'
+        if not os.path.isdir(folder):
+            console.print("[red]Error: La carpeta no existe[/red]")
+            return
+
+        chapter_files = list_chapter_files(folder)
+        if not chapter_files:
+            console.print("[red]No se encontraron archivos CBZ en la carpeta[/red]")
+            return
+
+        console.print("\n[bold]Capítulos disponibles:[/bold]")
+        for idx, path in enumerate(chapter_files):
+            console.print(f'{idx + 1}. {os.path.basename(path)}')
+
+        chapter_range = input("\nIntroduce el rango de capítulos del volumen (e.g., 1,10 o '1' para uno solo): ").strip()
+        try:
+            if ',' in chapter_range:
+                start, end = map(int, chapter_range.split(','))
+            else:
+                start = end = int(chapter_range)
+        except ValueError:
+            console.print("[red]Error: Formato inválido. Usa '1,10' o '1'[/red]")
+            return
+        if start < 1 or end > len(chapter_files) or start > end:
+            console.print("[red]Error: Rango de capítulos inválido[/red]")
+            return
+
+        volume_name = input("Nombre del volumen (e.g., Manga - Vol 01): ").strip()
+        if not volume_name:
+            console.print("[red]Error: El nombre del volumen no puede estar vacío[/red]")
+            return
+        volume_path = os.path.join(folder, f'{volume_name}.cbz')
+
+        append = False
+        if os.path.exists(volume_path):
+            answer = input("El volumen ya existe. ¿Añadir los capítulos al final? (s/n): ").strip().lower()
+            if answer != 's':
+                console.print("[yellow]Operación cancelada[/yellow]")
+                return
+            append = True
+
+        bundle_volume(chapter_files[start - 1:end], volume_path, append=append)
+
+    except KeyboardInterrupt:
+        console.print("\n[yellow]Operación cancelada por el usuario[/yellow]")
+    except Exception as e:
+        console.print(f"[red]Error inesperado: {e}[/red]")
+
+if __name__ == '__main__':
+    main()
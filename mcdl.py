@@ -0,0 +1,596 @@
+import os
+import re
+import json
+import shutil
+import tempfile
+import time
+import bisect
+import unicodedata
+import threading
+import argparse
+import cProfile
+import pstats
+import multiprocessing
+from queue import Empty
+from contextlib import contextmanager, nullcontext
+from urllib.parse import urlparse
+from rich.console import Console
+from rich.progress import Progress, BarColumn, TimeRemainingColumn, TextColumn
+
+# Infraestructura común de mtv4.py y nm3.py: trazas, límites de recursos, índice de capítulos y lotes multiproceso
+
+console = Console()
+
+class Tracer:
+    """
+    • Registra intervalos con proceso e hilo en formato trace-event de Chrome/Perfetto.
+    • Desactivado por defecto: span() devuelve un contexto vacío y no mide nada.
+    • Activado solo añade un diccionario a una lista por intervalo, apto para producción.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.thread_names = {}
+
+    def record(self, name, cat, start_ns, **args):
+        end_ns = time.perf_counter_ns()
+        thread = threading.current_thread()
+        self.thread_names[(os.getpid(), thread.ident)] = thread.name
+        # perf_counter usa el reloj monótono del sistema, comparable entre procesos
+        self.events.append({
+            'name': name,
+            'cat': cat,
+            'ph': 'X',
+            'ts': start_ns / 1000,
+            'dur': (end_ns - start_ns) / 1000,
+            'pid': os.getpid(),
+            'tid': thread.ident,
+            'args': args,
+        })
+
+    @contextmanager
+    def _span(self, name, cat, args):
+        start_ns = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(name, cat, start_ns, **args)
+
+    def span(self, name, cat='etapa', **args):
+        if not self.enabled:
+            return nullcontext()
+        return self._span(name, cat, args)
+
+    def dump(self, path):
+        metadata = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+            for (pid, tid), name in self.thread_names.items()
+        ]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': metadata + self.events, 'displayTimeUnit': 'ms'}, f)
+        console.print(f"[cyan]Trace guardado en {path} ({len(self.events)} eventos). Ábrelo en chrome://tracing o ui.perfetto.dev[/cyan]")
+
+tracer = Tracer()
+
+# Límites de recursos en vuelo: bytes en disco de los capítulos en curso y RAM de los procesos de descarga
+MAX_DISK_BYTES = 2 * 1024 ** 3
+MAX_RAM_BYTES = 1536 * 1024 ** 2
+# Espacio libre mínimo en la carpeta temporal y en la de los CBZ antes de empezar otra descarga
+MIN_FREE_BYTES = 256 * 1024 ** 2
+# Segundos de pausa esperando a que se libere un recurso antes de dar el capítulo por fallido
+MAX_WAIT_SECONDS = 300
+
+class ResourceLimitError(Exception):
+    """Un capítulo no cabe en los límites de recursos o el recurso no se liberó a tiempo."""
+
+def current_rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+def free_bytes(paths):
+    free = []
+    for path in paths:
+        try:
+            free.append(shutil.disk_usage(path).free)
+        except OSError:
+            continue
+    return min(free, default=None)
+
+class ResourceGovernor:
+    """
+    • Limita los bytes en vuelo en disco, el espacio libre real y la RAM de los procesos de descarga.
+    • Antes de cada imagen y de cada capítulo comprueba los límites; mientras se superen pausa y vuelve
+      a comprobar cada segundo, y si pasan max_wait segundos falla con ResourceLimitError.
+    • Por el disco en vuelo solo se espera a capítulos más antiguos: el más antiguo sigue aunque se pase,
+      así que dos capítulos nunca se esperan entre sí. Si sus propios bytes superan el límite, falla al momento.
+    • Con un Lock y dos dict de multiprocessing la cuenta se comparte entre procesos, como en RateBudget.
+    • Registra los máximos alcanzados para poder subir el paralelismo con seguridad.
+    """
+
+    def __init__(self, max_disk_bytes=MAX_DISK_BYTES, max_ram_bytes=MAX_RAM_BYTES, **options):
+        self.configure(max_disk_bytes, max_ram_bytes, **options)
+
+    def configure(self, max_disk_bytes, max_ram_bytes, min_free_bytes=MIN_FREE_BYTES, max_wait=MAX_WAIT_SECONDS,
+                  paths=None, lock=None, owned=None, memory=None):
+        # Se reconfigura en el sitio porque mtv4 y nm3 importan la instancia compartida
+        self.max_disk_bytes = max_disk_bytes
+        self.max_ram_bytes = max_ram_bytes
+        self.min_free_bytes = min_free_bytes
+        self.max_wait = max_wait
+        self.paths = paths
+        self.lock = lock if lock is not None else threading.Lock()
+        # Capítulo -> (momento en que empezó, bytes en disco); monotonic es comparable entre procesos
+        self.owned = owned if owned is not None else {}
+        # pid -> RSS de cada proceso que descarga
+        self.memory = memory if memory is not None else {}
+        self.peak_disk_bytes = 0
+        self.peak_ram_bytes = 0
+        self.peak_chapters = 0
+        self.pauses = 0
+
+    def _limit_reason(self, owner):
+        """Devuelve (motivo, permanente), o (None, False) si hay sitio."""
+        chapters = self.owned.copy()
+        started, own = chapters.get(owner, (float('inf'), 0))
+        if own >= self.max_disk_bytes:
+            return f"disco del propio capítulo ({own / 1024 ** 2:.1f} MB)", True
+        disk_bytes = sum(nbytes for _, nbytes in chapters.values())
+        if disk_bytes >= self.max_disk_bytes and any(other < started for other, _ in chapters.values()):
+            return f"disco en vuelo ({disk_bytes / 1024 ** 2:.1f} MB)", False
+        # La carpeta de trabajo recibe los CBZ terminados, que siguen ocupando disco
+        free = free_bytes(self.paths or (tempfile.gettempdir(), os.getcwd()))
+        if free is not None and free < self.min_free_bytes:
+            return f"espacio libre ({free / 1024 ** 2:.1f} MB)", False
+        self.memory[os.getpid()] = current_rss()
+        ram_bytes = sum(self.memory.values())
+        self.peak_ram_bytes = max(self.peak_ram_bytes, ram_bytes)
+        if ram_bytes >= self.max_ram_bytes:
+            return f"RAM ({ram_bytes / 1024 ** 2:.1f} MB)", False
+        return None, False
+
+    def _wait(self, owner=None):
+        start_ns = time.perf_counter_ns()
+        deadline = time.monotonic() + self.max_wait
+        paused = None
+        while True:
+            with self.lock:
+                reason, permanent = self._limit_reason(owner)
+            if reason is None:
+                break
+            if permanent or time.monotonic() >= deadline:
+                raise ResourceLimitError(f"Límite de recursos alcanzado: {reason}")
+            paused = reason
+            # Ni la RAM ni el disco avisan al liberarse, así que se vuelve a comprobar cada segundo
+            time.sleep(1)
+        if paused:
+            with self.lock:
+                self.pauses += 1
+            if tracer.enabled:
+                tracer.record('pausa por límite', 'recursos', start_ns, motivo=paused)
+
+    def wait_for_room(self, owner):
+        self._wait(owner)
+
+    @contextmanager
+    def chapter(self, owner):
+        self._wait()
+        with self.lock:
+            self.owned[owner] = (time.monotonic(), 0)
+            self.peak_chapters = max(self.peak_chapters, len(self.owned))
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.owned.pop(owner, None)
+
+    def add(self, owner, nbytes):
+        with self.lock:
+            started, total = self.owned[owner]
+            total += nbytes
+            self.owned[owner] = (started, total)
+            self.peak_disk_bytes = max(self.peak_disk_bytes, sum(n for _, n in self.owned.values()))
+        if total > self.max_disk_bytes:
+            raise ResourceLimitError(
+                f"El capítulo supera el límite de disco en vuelo ({self.max_disk_bytes / 1024 ** 2:.1f} MB)"
+            )
+
+    def replace(self, owner, nbytes):
+        # Las imágenes se borran al empaquetar: desde ahí el capítulo solo ocupa su CBZ
+        with self.lock:
+            started, _ = self.owned[owner]
+            self.owned[owner] = (started, nbytes)
+            self.peak_disk_bytes = max(self.peak_disk_bytes, sum(n for _, n in self.owned.values()))
+
+    def detach(self):
+        # Un proceso que termina deja de contar en la RAM compartida
+        with self.lock:
+            self.memory.pop(os.getpid(), None)
+
+    def peaks(self):
+        with self.lock:
+            return {
+                'disk': self.peak_disk_bytes,
+                'ram': max(self.peak_ram_bytes, current_rss()),
+                'chapters': self.peak_chapters,
+                'pauses': self.pauses,
+            }
+
+    def merge(self, peaks):
+        # Cada proceso mide sobre la cuenta compartida, así que el máximo conjunto es el mayor de todos
+        with self.lock:
+            self.peak_disk_bytes = max(self.peak_disk_bytes, peaks['disk'])
+            self.peak_ram_bytes = max(self.peak_ram_bytes, peaks['ram'])
+            self.peak_chapters = max(self.peak_chapters, peaks['chapters'])
+            self.pauses += peaks['pauses']
+
+    def report(self):
+        with self.lock:
+            self.peak_ram_bytes = max(self.peak_ram_bytes, current_rss())
+            console.print(
+                f"[cyan]Máximos en vuelo: disco {self.peak_disk_bytes / 1024 ** 2:.1f} MB, "
+                f"RAM {self.peak_ram_bytes / 1024 ** 2:.1f} MB, "
+                f"capítulos {self.peak_chapters} ({self.pauses} pausas por límite)[/cyan]"
+            )
+
+resource_governor = ResourceGovernor()
+
+class RateBudget:
+    """
+    • Presupuesto global de peticiones por segundo para cada host.
+    • Reparte turnos separados 1/rate segundos; con rate 0 no limita.
+    • Con un Lock y un dict de multiprocessing el presupuesto se comparte entre procesos.
+    """
+
+    def __init__(self, rate=0, lock=None, slots=None):
+        self.configure(rate, lock, slots)
+
+    def configure(self, rate, lock=None, slots=None):
+        self.rate = rate
+        self.interval = 1 / rate if rate else 0
+        self.lock = lock if lock is not None else threading.Lock()
+        self.slots = slots if slots is not None else {}
+
+    def wait(self, url):
+        if not self.interval:
+            return
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.slots.get(host, 0.0))
+            self.slots[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+rate_budget = RateBudget()
+
+# Versión preferida cuando un capítulo está subido varias veces: 'latest' o 'earliest'
+PREFERRED_VERSION = 'latest'
+CHAPTER_KEYWORD_NUMBER = re.compile(r'\b(?:cap[ií]tulo|chapter|cap|ch|ep)\.?\s*(\d+(?:[.,]\d+)?)', re.IGNORECASE)
+# Número que cierra el título o la parte anterior a un separador: 'Kimetsu 205 - End', 'Solo Leveling 110 (Final)'
+TITLE_NUMBER = re.compile(r'(?<![\d.,])(\d+(?:[.,]\d+)?)\s*(?=$|[-–—:(\[|])')
+
+def normalize_title(text):
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.casefold().split())
+
+def natural_key(text):
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', text)]
+
+def parse_chapter_number(text):
+    """
+    • Devuelve (número, resto del título tras el número) o None si el título no es un capítulo numerado.
+    • Solo cuenta el número tras una palabra clave ('Capítulo 10', 'Cap 5 Parte 2') o el primero que cierra
+      el título o va justo antes de un separador como '-', ':' o '(' ('One Piece 1090', 'Boku no Hero 400: Título');
+      'Especial 10 años' o 'Volumen 2 Extra' quedan como extras.
+    """
+    match = CHAPTER_KEYWORD_NUMBER.search(text) or TITLE_NUMBER.search(text)
+    if not match:
+        return None
+    return float(match.group(1).replace(',', '.')), normalize_title(text[match.end():])
+
+class ChapterIndex:
+    """
+    • Índice de capítulos de una serie ordenado por número, construido una vez por serie.
+    • Solo son duplicados las entradas con la misma URL o con el mismo título normalizado; se resuelven
+      con prefer: 'latest' conserva la subida más reciente y 'earliest' la más antigua.
+    • Los capítulos sin número heredan el del anterior para mantener su posición.
+    • Con el mismo número se ordenan por el texto que sigue al número ('Parte 1' antes que 'Parte 2').
+    • Los rangos por número se buscan en O(log n) con bisect.
+    """
+
+    def __init__(self, chapters, urls, prefer=PREFERRED_VERSION):
+        if prefer not in ('latest', 'earliest'):
+            raise ValueError(f"Política de duplicados desconocida: {prefer}")
+        entries = {}
+        seen_urls = set()
+        last_number = 0.0
+        # La web lista los capítulos del más reciente al más antiguo
+        for position, (name, url) in enumerate(zip(reversed(chapters), reversed(urls))):
+            if url in seen_urls:
+                continue
+            seen_urls.add(url)
+            title = normalize_title(name)
+            parsed = parse_chapter_number(name)
+            if parsed is None:
+                number, suffix, extra = last_number, title, True
+            else:
+                (number, suffix), extra = parsed, False
+                last_number = number
+            key = (number, extra, title)
+            if key in entries and prefer == 'earliest':
+                continue
+            if key in entries:
+                position = entries[key][3]
+            entries[key] = (number, extra, natural_key(suffix), position, name, url)
+
+        self.duplicates = len(chapters) - len(entries)
+        ordered = sorted(entries.values())
+        self.keys = [entry[0] for entry in ordered]
+        self.names = [entry[4] for entry in ordered]
+        self.urls = [entry[5] for entry in ordered]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def between(self, start, end):
+        return range(bisect.bisect_left(self.keys, start), bisect.bisect_right(self.keys, end))
+
+    def select(self, text):
+        """
+        • '1,3' o '5' eligen por posición en la lista mostrada.
+        • '10-25.5' elige por número de capítulo, ambos extremos incluidos.
+        • Devuelve un rango vacío si la selección no encaja y ValueError si el formato es inválido.
+        """
+        if '-' in text:
+            start, end = (float(part.strip().replace(',', '.')) for part in text.split('-'))
+            if start > end:
+                return range(0)
+            return self.between(start, end)
+        if ',' in text:
+            start, end = map(int, text.split(','))
+        else:
+            start = end = int(text)
+        if start < 1 or end > len(self) or start > end:
+            return range(0)
+        return range(start - 1, end)
+
+class Manifest:
+    """
+    • Estado de cada capítulo de un lote en un JSON compartido entre procesos.
+    • Cada lectura y escritura se hace bajo flock, y el archivo se reemplaza de forma atómica.
+    • Permite retomar un lote: los capítulos marcados como hechos no se vuelven a descargar.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+
+    @contextmanager
+    def locked(self):
+        # Solo hace falta con --workers; importarlo aquí permite usar el modo en serie en Windows
+        import fcntl
+        with open(self.lock_path, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield self._load()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _save(self, data):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.path)
+
+    def pending(self, jobs):
+        with self.locked() as data:
+            return [job for job in jobs if data.get(job[0], {}).get('estado') != 'hecho']
+
+    def update(self, url, name, status):
+        with self.locked() as data:
+            data[url] = {'capitulo': name, 'estado': status, 'pid': os.getpid()}
+            self._save(data)
+
+class QueueProgress:
+    """Sustituye a rich Progress en los procesos de trabajo y envía los avances al proceso padre."""
+
+    def __init__(self, events, worker):
+        self.events = events
+        self.worker = worker
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add_task(self, description, total=None):
+        self.events.put(('capitulo', self.worker, total))
+        return self.worker
+
+    def update(self, task, advance=0):
+        self.events.put(('avance', self.worker, advance))
+
+worker_progress = None
+
+def chapter_progress(make_progress):
+    # En los procesos de trabajo los avances van al padre en lugar de a una barra propia
+    return worker_progress or make_progress()
+
+def shard_worker(worker, jobs, next_job, manga_name, client_class, state, download_job, stop_on_error,
+                 manifest_path, budget, governor, events, stop, trace):
+    global worker_progress
+    rate_budget.configure(budget.rate, budget.lock, budget.slots)
+    # Los límites no se reparten: todos los procesos descuentan de la misma cuenta de disco y RAM
+    resource_governor.configure(governor.max_disk_bytes, governor.max_ram_bytes,
+                                lock=governor.lock, owned=governor.owned, memory=governor.memory)
+    worker_progress = QueueProgress(events, worker)
+    # El proceso hijo hereda los eventos del padre al hacer fork
+    tracer.enabled = trace
+    tracer.events = []
+    tracer.thread_names = {}
+    # Los mensajes se imprimen en el padre para no escribir encima de su barra de progreso
+    console.print = lambda *objects, **kwargs: events.put(('log', worker, [str(o) for o in objects]))
+
+    client = client_class(**state['options'])
+    client.import_state(state)
+    manifest = Manifest(manifest_path)
+    try:
+        while not stop.is_set():
+            # Los capítulos se reparten en orden desde un contador compartido, como en serie
+            with next_job.get_lock():
+                position = next_job.value
+                next_job.value += 1
+            if position >= len(jobs):
+                break
+            url, name = jobs[position]
+            ok = download_job(client, url, name, manga_name)
+            manifest.update(url, name, 'hecho' if ok else 'error')
+            events.put(('fin', worker, name, ok))
+            if not ok and stop_on_error:
+                # Igual que en serie: un error detiene el resto del lote
+                stop.set()
+                break
+    finally:
+        client.close()
+        resource_governor.detach()
+        events.put(('recursos', worker, resource_governor.peaks()))
+        if trace:
+            events.put(('trace', worker, tracer.events, tracer.thread_names))
+        events.put(('terminado', worker))
+
+def download_sharded(jobs, manga_name, client, workers, manifest_path, download_job, stop_on_error=False):
+    """
+    • Reparte los capítulos entre varios procesos para no depender de un solo GIL; cada proceso toma
+      el siguiente capítulo pendiente en orden, así que un error se detiene en el mismo punto que en serie
+      (salvo los capítulos posteriores que otros procesos ya tenían en curso, que terminan).
+    • download_job(client, url, nombre, manga) descarga un capítulo en el proceso hijo y devuelve si salió bien.
+    • Los procesos comparten el manifiesto, las cookies/cabeceras de la sesión, el límite de peticiones por host
+      y los límites de disco y RAM del gobernador de recursos.
+    • El proceso padre muestra un único progreso con los avances de todos los procesos.
+    """
+    manifest = Manifest(manifest_path)
+    pending = manifest.pending(jobs)
+    if len(pending) < len(jobs):
+        console.print(f"[yellow]Se omiten {len(jobs) - len(pending)} capítulos ya descargados según {manifest_path}[/yellow]")
+    if not pending:
+        return 0, 0
+    workers = min(workers, len(pending))
+
+    context = multiprocessing.get_context()
+    events = context.Queue()
+    stop = context.Event()
+    next_job = context.Value('i', 0)
+    state = client.export_state()
+    done = failed = 0
+
+    with context.Manager() as manager:
+        budget = RateBudget(rate_budget.rate, context.Lock(), manager.dict())
+        governor = ResourceGovernor(resource_governor.max_disk_bytes, resource_governor.max_ram_bytes,
+                                    lock=context.Lock(), owned=manager.dict(), memory=manager.dict())
+        processes = [
+            context.Process(
+                target=shard_worker,
+                args=(worker, pending, next_job, manga_name, type(client), state, download_job,
+                      stop_on_error, manifest_path, budget, governor, events, stop, tracer.enabled),
+                name=f"shard-{worker + 1}",
+            )
+            for worker in range(workers)
+        ]
+        for process in processes:
+            process.start()
+
+        with Progress(
+            TextColumn("{task.description}"),
+            BarColumn(),
+            TextColumn("{task.completed}/{task.total}"),
+            TimeRemainingColumn(),
+            console=console,
+        ) as progress:
+            overall = progress.add_task("[bold]Capítulos", total=len(pending))
+            tasks = [progress.add_task(f"[cyan]Proceso {worker + 1}", total=None) for worker in range(workers)]
+            finished = 0
+            while finished < workers:
+                try:
+                    message = events.get(timeout=1)
+                except Empty:
+                    if not any(process.is_alive() for process in processes):
+                        break
+                    continue
+                kind, worker = message[0], message[1]
+                if kind == 'capitulo':
+                    progress.reset(tasks[worker], total=message[2])
+                elif kind == 'avance':
+                    progress.update(tasks[worker], advance=message[2])
+                elif kind == 'fin':
+                    progress.update(overall, advance=1)
+                    if message[3]:
+                        done += 1
+                    else:
+                        failed += 1
+                        progress.console.print(f"[red]Error al descargar el capítulo:[/red] {message[2]}")
+                elif kind == 'log':
+                    progress.console.print(*message[2])
+                elif kind == 'recursos':
+                    resource_governor.merge(message[2])
+                elif kind == 'trace':
+                    tracer.events.extend(message[2])
+                    tracer.thread_names.update(message[3])
+                elif kind == 'terminado':
+                    finished += 1
+
+        for process in processes:
+            process.join()
+
+    if stop.is_set():
+        console.print("[red]Se detuvo la descarga debido a errores[/red]")
+    console.print(f"[bold]Lote terminado: {done} capítulos descargados, {failed} con errores[/bold]")
+    return done, failed
+
+def parse_args(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--trace', metavar='ARCHIVO',
+                        help="guardar un trace JSON (Chrome/Perfetto) con cada etapa y petición por hilo")
+    parser.add_argument('--profile', metavar='ARCHIVO',
+                        help="ejecutar con cProfile y guardar las estadísticas ordenadas por tiempo acumulado")
+    parser.add_argument('--workers', type=int, default=1, metavar='N',
+                        help="repartir los capítulos en orden entre N procesos (por defecto 1, sin procesos extra); "
+                             "si un capítulo falla y la descarga se detiene, los posteriores que ya estaban "
+                             "en curso en otros procesos terminan igualmente")
+    parser.add_argument('--rate', type=float, default=0, metavar='PETICIONES',
+                        help="máximo de peticiones por segundo a cada host, compartido entre procesos (0 sin límite)")
+    parser.add_argument('--manifest', metavar='ARCHIVO',
+                        help="manifiesto JSON del lote con --workers (por defecto '<manga>.manifest.json')")
+    return parser.parse_args()
+
+def run(args, main):
+    tracer.enabled = bool(args.trace)
+    rate_budget.configure(args.rate)
+    try:
+        if args.profile:
+            # cProfile solo mide el hilo principal; el detalle por hilo está en --trace
+            profiler = cProfile.Profile()
+            try:
+                profiler.runcall(main, args.workers, args.manifest)
+            finally:
+                with open(args.profile, 'w', encoding='utf-8') as f:
+                    pstats.Stats(profiler, stream=f).sort_stats('cumulative').print_stats()
+                console.print(f"[cyan]Perfil guardado en {args.profile}[/cyan]")
+        else:
+            main(args.workers, args.manifest)
+    finally:
+        if args.trace:
+            tracer.dump(args.trace)
+
@@ -9,19 +9,20 @@ import time
 from urllib.parse import urlparse, urljoin, quote_plus
 from bs4 import BeautifulSoup
 import re
-from rich.console import Console
 from rich.progress import Progress, BarColumn, TimeRemainingColumn, TextColumn
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
-
-console = Console()
+from mcdl import (
+    console, tracer, resource_governor, rate_budget, ResourceLimitError, ChapterIndex, PREFERRED_VERSION,
+    chapter_progress, download_sharded, parse_args, run,
+)
 
 def shorten_filename(filename):
     if len(filename) > 50:
         return filename[:30] + '...' + filename[-20:]
     return filename
-    
+
 class MangaClient:
     base_url = urlparse("https://www.mangatv.net/")
     search_param = 's'
@@ -56,9 +57,11 @@ class MangaClient:
         
         while retries < max_retries:
             try:
-                response = self.session.get(url, timeout=timeout)
-                response.raise_for_status()
-                return response.content
+                rate_budget.wait(url)
+                with tracer.span('GET', 'http', url=url, intento=retries + 1):
+                    response = self.session.get(url, timeout=timeout)
+                    response.raise_for_status()
+                    return response.content
             except requests.exceptions.RequestException as e:
                 last_exception = e
                 retries += 1
@@ -92,19 +95,17 @@ class MangaClient:
         items = container.find_all("li")
         links = [item.find("a", {"class": "dload"}).get("href") for item in items]
         texts = [item.find("span", {"class": "chapternum"}).text.strip() for item in items]
-
-        # Filtrar capítulos duplicados por nombre
-        unique_chapters = {}
-        for text, link in zip(texts, links):
-            if text not in unique_chapters:
-                unique_chapters[text] = link
-        return list(unique_chapters.keys()), list(unique_chapters.values())
+        return texts, links
 
     def get_chapters(self, manga_url: str):
         content = self.get_url(manga_url)
         chapters, links = self.chapters_from_page(content)
         return chapters, links
 
+    def get_chapter_index(self, manga_url: str, prefer=PREFERRED_VERSION):
+        chapters, links = self.get_chapters(manga_url)
+        return ChapterIndex(chapters, links, prefer=prefer)
+
     def pictures_from_chapter(self, chapter_url: str):
         """
         • Descarga el contenido de la página del capítulo con reintentos.
@@ -162,14 +163,15 @@ try {{
 
             try:
                 # Aumentamos el timeout para conexiones lentas
-                proc = subprocess.run(
-                    ["node", temp_js_name],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    timeout=60,  # Mayor tiempo de espera
-                    text=True,
-                    encoding='utf-8'
-                )
+                with tracer.span('node', 'subprocess', url=chapter_url):
+                    proc = subprocess.run(
+                        ["node", temp_js_name],
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.PIPE,
+                        timeout=60,  # Mayor tiempo de espera
+                        text=True,
+                        encoding='utf-8'
+                    )
                 os.unlink(temp_js_name)
                 
                 if proc.returncode != 0:
@@ -250,26 +252,49 @@ try {{
             console.print(f"[red]Error inesperado en pictures_from_chapter: {e}[/red]")
             return []
 
+    def export_state(self):
+        return {
+            'options': {},
+            'headers': dict(self.session.headers),
+            'cookies': [
+                {'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path}
+                for c in self.session.cookies
+            ],
+        }
+
+    def import_state(self, state):
+        self.session.headers.update(state['headers'])
+        for cookie in state['cookies']:
+            self.session.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'], path=cookie['path'])
+
     def close(self):
         self.session.close()
 
-def download_image(url, folder, idx, task, progress, session):
+def download_image(url, folder, idx, task, progress, session, governor, owner):
     max_retries = 5
     retry_delay = 2  # segundos
     
     for attempt in range(max_retries):
+        written = 0
         try:
-            response = session.get(url, stream=True, timeout=(10, 30))  # 10s conexión, 30s lectura
-            response.raise_for_status()
-            
-            file_path = os.path.join(folder, f'{idx + 1:04d}.jpg')
-            temp_file_path = f"{file_path}.tmp"
-            
-            # Descarga en bloques con manejo de errores
-            with open(temp_file_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:  # Filtrar keep-alive chunks
-                        f.write(chunk)
+            # Pausar mientras se supere un límite; falla si no se libera a tiempo o el capítulo no cabe
+            governor.wait_for_room(owner)
+            rate_budget.wait(url)
+            with tracer.span('imagen', 'http', pagina=idx + 1, intento=attempt + 1):
+                response = session.get(url, stream=True, timeout=(10, 30))  # 10s conexión, 30s lectura
+                response.raise_for_status()
+                
+                file_path = os.path.join(folder, f'{idx + 1:04d}.jpg')
+                temp_file_path = f"{file_path}.tmp"
+                
+                # Descarga en bloques con manejo de errores
+                with open(temp_file_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=8192):
+                        if chunk:  # Filtrar keep-alive chunks
+                            f.write(chunk)
+                            written += len(chunk)
+                # La imagen se cuenta entera una vez escrita, con una sola llamada al gobernador
+                governor.add(owner, written)
             
             # Renombrar solo si la descarga fue exitosa
             os.rename(temp_file_path, file_path)
@@ -285,12 +310,26 @@ def download_image(url, folder, idx, task, progress, session):
                 console.print(f"[red]Error persistente al descargar la imagen {idx + 1}: {e}[/red]")
                 progress.update(task, advance=1)
                 return
+        except ResourceLimitError:
+            # Se aborta el capítulo entero en lugar de empaquetarlo con páginas de menos
+            raise
         except Exception as e:
             console.print(f"[red]Error inesperado al descargar imagen {idx + 1}: {e}[/red]")
             progress.update(task, advance=1)
             return
 
-def download_chapter(chapter_url, manga_name, chapter_name, client):
+def download_chapter(chapter_url, manga_name, chapter_name, client, governor=None):
+    governor = governor or resource_governor
+    owner = f"{manga_name} - {chapter_name}"
+    # Los bytes de la carpeta temporal y del CBZ a medio escribir se liberan al salir del capítulo
+    try:
+        with tracer.span('capítulo', 'capítulo', capitulo=owner), governor.chapter(owner):
+            return fetch_chapter(chapter_url, manga_name, chapter_name, client, governor, owner)
+    except ResourceLimitError as e:
+        console.print(f"[red]Error: {e}. Capítulo no descargado:[/red] {chapter_name}")
+        return False
+
+def fetch_chapter(chapter_url, manga_name, chapter_name, client, governor, owner):
     images = client.pictures_from_chapter(chapter_url)
     if not images:
         console.print(f"[red]Error al obtener las imágenes del capítulo:[/red] {chapter_name}")
@@ -315,19 +354,19 @@ def download_chapter(chapter_url, manga_name, chapter_name, client):
     })
 
     try:
-        with Progress(
+        with chapter_progress(lambda: Progress(
             "[progress.percentage]{task.percentage:>3.1f}%",
             BarColumn(),
             TextColumn("{task.completed} de {task.total} imágenes"),
             TimeRemainingColumn(),
             console=console,
-        ) as progress:
+        )) as progress:
             task = progress.add_task("[cyan]Descargando imágenes...", total=len(images))
             
             # Reducir workers para conexiones lentas
             with ThreadPoolExecutor(max_workers=10) as executor:
                 futures = [
-                    executor.submit(download_image, img, folder, idx, task, progress, session)
+                    executor.submit(download_image, img, folder, idx, task, progress, session, governor, owner)
                     for idx, img in enumerate(images)
                 ]
                 for future in as_completed(futures):
@@ -344,7 +383,8 @@ def download_chapter(chapter_url, manga_name, chapter_name, client):
         temp_cbz = shorten_filename(temp_cbz)
 
         try:
-            with zipfile.ZipFile(temp_cbz, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=6) as archive:
+            with tracer.span('zip', 'io', archivo=cbz_filename), \
+                    zipfile.ZipFile(temp_cbz, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=6) as archive:
                 for root, _, files in os.walk(folder):
                     for file in sorted(files):
                         if file.endswith('.jpg'):
@@ -352,6 +392,8 @@ def download_chapter(chapter_url, manga_name, chapter_name, client):
                                 os.path.join(root, file),
                                 arcname=os.path.join(chapter_name, file)
                             )
+            # La carpeta temporal se borra al salir, así que el CBZ sustituye a las imágenes en la cuenta
+            governor.replace(owner, os.path.getsize(temp_cbz))
             
             # Renombrar solo si el ZIP se creó correctamente
             os.rename(temp_cbz, cbz_filename)
@@ -371,7 +413,10 @@ def download_chapter(chapter_url, manga_name, chapter_name, client):
         except Exception as e:
             console.print(f"[yellow]Advertencia al eliminar la carpeta temporal: {e}[/yellow]")
 
-def main():
+def download_job(client, url, name, manga_name):
+    return bool(download_chapter(url, manga_name, name, client))
+
+def main(workers=1, manifest_path=None):
     client = MangaClient()
     try:
         while True:
@@ -400,45 +445,44 @@ def main():
                     continue
 
                 console.print(f"\n[bold]Obteniendo capítulos para {mangas[manga_choice]}...[/bold]")
-                chapters, chapter_urls = client.get_chapters(manga_urls[manga_choice])
+                index = client.get_chapter_index(manga_urls[manga_choice])
                 manga_name = mangas[manga_choice]
 
-                if not chapters:
+                if not index:
                     console.print("[red]No se encontraron capítulos para este manga[/red]")
                     continue
-
-                chapters.reverse()
-                chapter_urls.reverse()
+                if index.duplicates:
+                    console.print(f"[yellow]Se omitieron {index.duplicates} capítulos duplicados[/yellow]")
 
                 console.print("\n[bold]Capítulos disponibles:[/bold]")
-                for idx, name in enumerate(chapters):
+                for idx, name in enumerate(index.names):
                     console.print(f'{idx + 1}. {name}')
 
                 while True:
-                    chapter_range = input("\nIntroduce el rango de capítulos a descargar (e.g., 1,3 o '1' para un solo capítulo): ").strip()
+                    chapter_range = input("\nIntroduce el rango de capítulos a descargar (e.g., 1,3 o '1' por posición, 10-25.5 por número de capítulo): ").strip()
                     try:
-                        if ',' in chapter_range:
-                            start, end = map(int, chapter_range.split(','))
-                            start_chapter = start - 1
-                            end_chapter = end - 1
-                        else:
-                            start_chapter = end_chapter = int(chapter_range) - 1
-
-                        if start_chapter < 0 or end_chapter >= len(chapters) or start_chapter > end_chapter:
+                        selection = index.select(chapter_range)
+                        if not selection:
                             console.print("[red]Error: Rango de capítulos inválido[/red]")
                             continue
                         break
                     except ValueError:
-                        console.print("[red]Error: Formato inválido. Usa '1,3' o '1'[/red]")
+                        console.print("[red]Error: Formato inválido. Usa '1,3', '1' o '10-25.5'[/red]")
 
-                console.print(f"\n[bold]Preparando para descargar capítulos {start_chapter + 1} a {end_chapter + 1}...[/bold]")
+                console.print(f"\n[bold]Preparando para descargar capítulos {index.names[selection[0]]} a {index.names[selection[-1]]}...[/bold]")
                 
+                if workers > 1:
+                    jobs = [(index.urls[idx], index.names[idx]) for idx in selection]
+                    download_sharded(jobs, manga_name, client, workers, manifest_path or f'{manga_name}.manifest.json',
+                                     download_job, stop_on_error=True)
+                    break
+
                 # Descargar capítulos en serie para conexiones lentas
-                for idx in range(start_chapter, end_chapter + 1):
+                for idx in selection:
                     success = download_chapter(
-                        chapter_urls[idx], 
+                        index.urls[idx], 
                         manga_name, 
-                        chapters[idx], 
+                        index.names[idx], 
                         client
                     )
                     if not success:
@@ -456,6 +500,7 @@ def main():
                 
     finally:
         client.close()
+        resource_governor.report()
 
 if __name__ == '__main__':
-    main()
+    run(parse_args("Descarga capítulos de MangaTV como CBZ"), main)
@@ -7,10 +7,11 @@ import concurrent.futures
 import requests
 from urllib.parse import urlparse, urljoin, quote_plus
 from bs4 import BeautifulSoup
-from rich.console import Console
 from rich.progress import Progress, BarColumn, TextColumn, TimeRemainingColumn
-
-console = Console()
+from mcdl import (
+    console, tracer, resource_governor, rate_budget, ResourceLimitError, ChapterIndex, PREFERRED_VERSION,
+    chapter_progress, download_sharded, parse_args, run,
+)
 
 class MangaClient:
     base_urls = {
@@ -44,7 +45,9 @@ class MangaClient:
     def get_url(self, url, retries=3):
         for attempt in range(retries):
             try:
-                response = self.scraper.get(url)
+                rate_budget.wait(url)
+                with tracer.span('GET', 'http', url=url, intento=attempt + 1):
+                    response = self.scraper.get(url)
                 if response.status_code == 404:
                     console.print(f"[red]Error 404: URL no encontrada {url}[/red]")
                     return None
@@ -100,7 +103,15 @@ class MangaClient:
             chapters, links = self.chapters_from_page(content)
         return chapters, links
 
+    def get_chapter_index(self, manga_url: str, prefer=PREFERRED_VERSION):
+        chapters, links = self.get_chapters(manga_url)
+        return ChapterIndex(chapters, links, prefer=prefer)
+
     def pictures_from_chapter(self, chapter_url: str):
+        with tracer.span('páginas del capítulo', 'crawl', url=chapter_url):
+            return self.crawl_chapter_pages(chapter_url)
+
+    def crawl_chapter_pages(self, chapter_url: str):
         images_url = []
         base_chapter = chapter_url.rsplit(".html", 1)[0]
         page = 1
@@ -120,10 +131,28 @@ class MangaClient:
             page += 1
         return images_url
 
+    def export_state(self):
+        return {
+            'options': {'language': self.language},
+            'headers': dict(self.scraper.headers),
+            'cookies': [
+                {'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path}
+                for c in self.scraper.cookies
+            ],
+        }
+
+    def import_state(self, state):
+        # Reutiliza las cookies de Cloudflare ya obtenidas por el proceso padre
+        self.scraper.headers.update(state['headers'])
+        for cookie in state['cookies']:
+            self.scraper.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'], path=cookie['path'])
+
     def close(self):
         pass
 
-def download_image(url, folder, idx, semaphore):
+DRIVE_PATH = "/content/drive/MyDrive/Mangas"
+
+def download_image(url, folder, idx, semaphore, governor, owner):
     headers = {
         'User-Agent': ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
                        '(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'),
@@ -132,23 +161,50 @@ def download_image(url, folder, idx, semaphore):
     
     with semaphore:
         scraper = cloudscraper.create_scraper()
+        written = 0
         try:
-            response = scraper.get(url, headers=headers, stream=True)
-            response.raise_for_status()
-            
-            # Usar chunks para descargar la imagen
-            file_path = os.path.join(folder, f'{idx + 1}.jpg')
-            with open(file_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
+            # Pausar mientras se supere un límite; falla si no se libera a tiempo o el capítulo no cabe
+            governor.wait_for_room(owner)
+            rate_budget.wait(url)
+            with tracer.span('imagen', 'http', pagina=idx + 1):
+                response = scraper.get(url, headers=headers, stream=True)
+                response.raise_for_status()
+                
+                # Usar chunks para descargar la imagen
+                file_path = os.path.join(folder, f'{idx + 1}.jpg')
+                with open(file_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=8192):
+                        if chunk:
+                            f.write(chunk)
+                            written += len(chunk)
+                # La imagen se cuenta entera una vez escrita, con una sola llamada al gobernador
+                governor.add(owner, written)
             return True
+        except ResourceLimitError:
+            # Se aborta el capítulo entero en lugar de empaquetarlo con páginas de menos
+            raise
         except Exception as e:
             console.print(f"[red]Error al descargar imagen {url}: {str(e)}[/red]")
             return False
 
-def download_chapter(chapter_url, chapter_name, client, manga_name, drive_path="/content/drive/MyDrive/Mangas"):
-    chapter_name = "".join(c for c in chapter_name if c.isalnum() or c in (' ', '.', '_')).rstrip()
+def clean_chapter_name(chapter_name):
+    return "".join(c for c in chapter_name if c.isalnum() or c in (' ', '.', '_')).rstrip()
+
+def drive_chapter_path(chapter_name, manga_name, drive_path=DRIVE_PATH):
+    return os.path.join(drive_path, manga_name, f'{clean_chapter_name(chapter_name)}.cbz')
+
+def download_chapter(chapter_url, chapter_name, client, manga_name, drive_path=DRIVE_PATH, governor=None):
+    chapter_name = clean_chapter_name(chapter_name)
+    governor = governor or resource_governor
+    # Los bytes de la carpeta temporal y del CBZ pendiente de mover se liberan al salir del capítulo
+    try:
+        with tracer.span('capítulo', 'capítulo', capitulo=chapter_name), governor.chapter(chapter_name):
+            return fetch_chapter(chapter_url, chapter_name, client, manga_name, drive_path, governor)
+    except ResourceLimitError as e:
+        console.print(f"[red]Error: {e}. Capítulo no descargado:[/red] {chapter_name}")
+        return None
+
+def fetch_chapter(chapter_url, chapter_name, client, manga_name, drive_path, governor):
     images = client.pictures_from_chapter(chapter_url)
     if not images:
         console.print(f"[red]Error al descargar el capítulo: {chapter_name} (no se encontraron imágenes)[/red]")
@@ -160,38 +216,47 @@ def download_chapter(chapter_url, chapter_name, client, manga_name, drive_path="
     # Configurar el semáforo para limitar a 10 hilos concurrentes
     semaphore = concurrent.futures.ThreadPoolExecutor(max_workers=1)
     
-    with Progress(
-        TextColumn("[progress.description]{task.description}"),
-        BarColumn(),
-        TextColumn("[progress.percentage]{task.percentage:>3.1f}%"),
-        TextColumn("[blue]({task.completed}/{task.total} imágenes)[/blue]"),
-        TimeRemainingColumn()
-    ) as progress:
-        task = progress.add_task("Descargando imágenes...", total=len(images))
+    try:
+        with chapter_progress(lambda: Progress(
+            TextColumn("[progress.description]{task.description}"),
+            BarColumn(),
+            TextColumn("[progress.percentage]{task.percentage:>3.1f}%"),
+            TextColumn("[blue]({task.completed}/{task.total} imágenes)[/blue]"),
+            TimeRemainingColumn()
+        )) as progress:
+            task = progress.add_task("Descargando imágenes...", total=len(images))
         
-        # Usar ThreadPoolExecutor para descargas paralelas
-        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
-            futures = []
-            for idx, img in enumerate(images):
-                futures.append(executor.submit(download_image, img, folder, idx, semaphore))
+            # Usar ThreadPoolExecutor para descargas paralelas
+            with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+                futures = []
+                for idx, img in enumerate(images):
+                    futures.append(executor.submit(download_image, img, folder, idx, semaphore, governor, chapter_name))
             
-            for future in concurrent.futures.as_completed(futures):
-                future.result()  # Esto puede lanzar excepciones si ocurrieron durante la descarga
-                progress.update(task, advance=1)
+                for future in concurrent.futures.as_completed(futures):
+                    future.result()  # Esto puede lanzar excepciones si ocurrieron durante la descarga
+                    progress.update(task, advance=1)
+    except ResourceLimitError:
+        shutil.rmtree(folder, ignore_errors=True)
+        raise
 
     cbz_filename = f'{chapter_name}.cbz'
     try:
-        with zipfile.ZipFile(cbz_filename, 'w') as archive:
+        with tracer.span('zip', 'io', archivo=cbz_filename), zipfile.ZipFile(cbz_filename, 'w') as archive:
             for root, _, files in os.walk(folder):
                 for file in files:
                     file_path = os.path.join(root, file)
                     archive.write(file_path, arcname=os.path.join(chapter_name, file))
     except Exception as e:
         console.print(f"[red]Error al crear el archivo CBZ: {str(e)}[/red]")
+        if os.path.exists(cbz_filename):
+            os.remove(cbz_filename)
         return None
     finally:
         shutil.rmtree(folder, ignore_errors=True)
 
+    # La carpeta temporal ya no existe: hasta moverlo a Drive el capítulo solo ocupa el CBZ
+    governor.replace(chapter_name, os.path.getsize(cbz_filename))
+
     # Mover el archivo a Google Drive
     try:
         # Crear la carpeta del manga en Drive si no existe
@@ -202,7 +267,8 @@ def download_chapter(chapter_url, chapter_name, client, manga_name, drive_path="
         drive_cbz_path = os.path.join(manga_folder, cbz_filename)
         
         # Mover el archivo
-        shutil.move(cbz_filename, drive_cbz_path)
+        with tracer.span('mover a Drive', 'io', destino=drive_cbz_path):
+            shutil.move(cbz_filename, drive_cbz_path)
         console.print(f"[bold green]Archivo movido a:[/bold green] {drive_cbz_path}")
         
         return drive_cbz_path
@@ -211,7 +277,11 @@ def download_chapter(chapter_url, chapter_name, client, manga_name, drive_path="
         # Si falla el movimiento, devolver la ruta local
         return cbz_filename
 
-def main():
+def download_job(client, url, name, manga_name):
+    # Si falla el movimiento a Drive se devuelve la ruta local: eso no cuenta como hecho
+    return download_chapter(url, name, client, manga_name) == drive_chapter_path(name, manga_name)
+
+def main(workers=1, manifest_path=None):
     # Selección de idioma
     console.print("\n[bold blue]Selecciona el idioma:[/bold blue]")
     console.print("1. Español")
@@ -253,38 +323,41 @@ def main():
         selected_manga_name = mangas[manga_choice]
         console.print(f"[bold green]Manga seleccionado:[/bold green] {selected_manga_name}")
 
-        chapters, chapter_urls = client.get_chapters(manga_urls[manga_choice])
-        if not chapters:
+        index = client.get_chapter_index(manga_urls[manga_choice])
+        if not index:
             console.print("[red]No se encontraron capítulos para este manga.[/red]")
             return
-
-        chapters.reverse()
-        chapter_urls.reverse()
+        if index.duplicates:
+            console.print(f"[yellow]Se omitieron {index.duplicates} capítulos duplicados.[/yellow]")
 
         console.print("\n[bold underline]Capítulos disponibles:[/bold underline]")
-        for idx, name in enumerate(chapters):
+        for idx, name in enumerate(index.names):
             console.print(f'{idx + 1}. {name}')
 
-        chapter_input = console.input("\n[bold blue]Introduce el rango de capítulos a descargar (ej. 1,3 o solo 5): [/bold blue]").strip()
-        chapter_range = chapter_input.split(',')
+        chapter_input = console.input("\n[bold blue]Introduce el rango de capítulos a descargar (ej. 1,3 o solo 5 por posición, 10-25.5 por número): [/bold blue]").strip()
 
         try:
-            start_chapter = int(chapter_range[0]) - 1
-            end_chapter = start_chapter if len(chapter_range) == 1 else int(chapter_range[1]) - 1
-            if start_chapter < 0 or end_chapter >= len(chapters) or start_chapter > end_chapter:
+            selection = index.select(chapter_input)
+            if not selection:
                 console.print("[red]Rango de capítulos inválido.[/red]")
                 return
-        except (ValueError, IndexError):
-            console.print("[red]Formato de rango inválido. Usa formato como '1,3' o '5'.[/red]")
+        except ValueError:
+            console.print("[red]Formato de rango inválido. Usa formato como '1,3', '5' o '10-25.5'.[/red]")
+            return
+
+        console.print(f"\n[bold green]Descargando capítulos del {index.names[selection[0]]} al {index.names[selection[-1]]}...[/bold green]")
+        if workers > 1:
+            jobs = [(index.urls[idx], index.names[idx]) for idx in selection]
+            download_sharded(jobs, selected_manga_name, client, workers, manifest_path or f'{selected_manga_name}.manifest.json',
+                             download_job)
             return
 
-        console.print(f"\n[bold green]Descargando capítulos del {start_chapter + 1} al {end_chapter + 1}...[/bold green]")
-        for idx in range(start_chapter, end_chapter + 1):
-            result = download_chapter(chapter_urls[idx], chapters[idx], client, selected_manga_name)
+        for idx in selection:
+            result = download_chapter(index.urls[idx], index.names[idx], client, selected_manga_name)
             if result:
                 console.print(f"[bold green]Capítulo descargado:[/bold green] {result}")
             else:
-                console.print(f"[red]Error al descargar el capítulo:[/red] {chapters[idx]}")
+                console.print(f"[red]Error al descargar el capítulo:[/red] {index.names[idx]}")
 
     except KeyboardInterrupt:
         console.print("\n[red]Descarga cancelada por el usuario.[/red]")
@@ -292,6 +365,7 @@ def main():
         console.print(f"[red]Error inesperado: {str(e)}[/red]")
     finally:
         client.close()
+        resource_governor.report()
 
 if __name__ == '__main__':
-    main()
+    run(parse_args("Descarga capítulos de NineManga como CBZ y los mueve a Google Drive"), main)